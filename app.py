@@ -1,5 +1,5 @@
 import asyncio
-import json
+import os
 import uuid
 from pathlib import Path
 from typing import List, Tuple
@@ -7,9 +7,8 @@ from typing import List, Tuple
 import shutil
 from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
-from scipy.special.cython_special import wofz
 
-from main import run_unified
+from main import run_unified, _json_loads, _IMAGE_EXTS
 import logging
 
 # 应用初始化
@@ -22,19 +21,21 @@ app = FastAPI(
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 logger = logging.getLogger("paddleocr_vl")
 
+# 上传文件落盘时的分块大小（1 MiB）
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
 
 def _classify_files(files: List[UploadFile]) -> Tuple[List[UploadFile], List[UploadFile], List[str]]:
     """
     将上传文件按类型分类为图片列表与 PDF 列表，并返回警告列表。
-    - 允许的图片后缀：.png/.jpg/.jpeg/.bmp/.tif/.tiff/.webp
+    - 允许的图片后缀：与处理管线共用 main._IMAGE_EXTS
     - 允许的 PDF 后缀：.pdf
     """
-    allowed_img_exts = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
     images, pdfs, warnings = [], [], []
     for f in files:
         name = f.filename or ""
-        ext = Path(name).suffix.lower()
-        if ext in allowed_img_exts:
+        ext = os.path.splitext(name)[1].lower()
+        if ext in _IMAGE_EXTS:
             images.append(f)
         elif ext == ".pdf":
             pdfs.append(f)
@@ -46,6 +47,7 @@ def _classify_files(files: List[UploadFile]) -> Tuple[List[UploadFile], List[Upl
 async def _save_uploads(request_id: str, files: List[UploadFile]) -> List[Path]:
     """
     将上传的文件保存到本地临时目录 uploads/{request_id}/ 并返回本地路径列表。
+    - 按固定大小分块读取并写盘，内存占用与文件大小无关
     """
     base_dir = Path(__file__).parent / "uploads" / request_id
     base_dir.mkdir(parents=True, exist_ok=True)
@@ -54,8 +56,12 @@ async def _save_uploads(request_id: str, files: List[UploadFile]) -> List[Path]:
         # 为避免重名覆盖，前缀加序号
         filename = f.filename or f"file_{idx}"
         local_path = base_dir / filename
-        content = await f.read()
-        local_path.write_bytes(content)
+        with open(local_path, "wb") as out:
+            while True:
+                chunk = await f.read(_UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                out.write(chunk)
         local_paths.append(local_path)
     return local_paths
 
@@ -113,9 +119,9 @@ async def parse_docs(files: List[UploadFile] = File(...), background_tasks: Back
         input_arg = [str(p) for p in saved_paths]
         # 同步调用耗时函数，避免阻塞事件循环
         result_json = await asyncio.to_thread(run_unified, input_arg, output_dir)
-        # 解析为对象
+        # 解析为对象（超过 19 位的整数与 NaN 等由标准库解析，不丢失精度）
         try:
-            data = json.loads(result_json)
+            data, _ = _json_loads(result_json)
         except Exception:
             # 若解析失败，原样返回字符串
             data = result_json
@@ -148,4 +154,4 @@ async def parse_docs(files: List[UploadFile] = File(...), background_tasks: Back
         )
 
 # 启动服务自定义API服务
-# uvicorn app:app --host 0.0.0.0 --port 8080 --workers 4 --log-level info
+# uvicorn app:app --host 0.0.0.0 --port 8080 --workers 4 --loop uvloop --http httptools --log-level info
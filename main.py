@@ -1,24 +1,99 @@
 import argparse
-import base64
+import asyncio
+import binascii
+import hashlib
+import io
 import json
 import logging
+import mmap
 import os
+import re
+import stat
+import sys
+import tempfile
 import threading
+import time
 import warnings
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import List, Dict, Set, Tuple
 
 import cv2
+import numpy as np
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, AsyncOpenAI, OpenAI, RateLimitError
 from paddleocr import PaddleOCRVL
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 from templates import json_data
 
+try:
+    # 可选依赖：NVIDIA nvImageCodec，用于在 GPU 上解码图片
+    from nvidia import nvimgcodec
+except ImportError:
+    nvimgcodec = None
+
 _PIPELINE_INSTANCE = None
 _PIPELINE_LOCK = threading.Lock()
+_LLM_CLIENT = None
+_LLM_CLIENT_LOCK = threading.Lock()
+_LLM_LIMITER = None
+_LLM_LIMITER_LOCK = threading.Lock()
 logger = logging.getLogger("paddleocr_vl")
 
+# 支持的图片后缀
+_IMAGE_EXTS = frozenset({".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"})
+# 图片预取解码的线程数（cv2 解码时释放 GIL）
+_DECODE_WORKERS = 4
+# 图片扩展名到 MIME 类型的映射，用于生成 data URI
+_EXT_MIME = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".bmp": "image/bmp",
+    ".gif": "image/gif",
+    ".tif": "image/tiff",
+    ".tiff": "image/tiff",
+}
+# 新版 OpenCV 支持解码时直接输出 RGB，旧版本为 None
+_IMREAD_COLOR_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+# 小于该大小的图片以 mmap 一次性编码，更大的文件分块流式编码
+_MMAP_MAX_SIZE = 64 << 20
+# 读取图片时 os.open 的标志：O_NONBLOCK 避免误打开 FIFO 时阻塞（对普通文件无影响），Windows 需 O_BINARY
+_OPEN_RDONLY_FLAGS = os.O_RDONLY | getattr(os, "O_NONBLOCK", 0) | getattr(os, "O_BINARY", 0)
+# 流式 base64 编码的块大小（必须是 3 的倍数）
+_B64_CHUNK_SIZE = 48 * 1024
+# 单个图片数组内并行 base64 编码的最大线程数
+_B64_WORKERS = 8
+# 设置 PAPERCUTTER_GPU_DECODE 且已安装 nvImageCodec 时，优先使用 GPU 解码图片
+_GPU_DECODE = nvimgcodec is not None and bool(os.environ.get("PAPERCUTTER_GPU_DECODE"))
+# 每个解码线程各自持有一个 nvImageCodec 解码器
+_GPU_DECODER_LOCAL = threading.local()
+# 单次 pipeline.predict 调用传入的图片数
+_PREDICT_BATCH_SIZE = 8
+# 大模型抽取结果的磁盘缓存目录；默认关闭，设置 PAPERCUTTER_LLM_CACHE 或调用 enable_llm_cache() 后才读写
+_LLM_CACHE_DIR = Path(__file__).resolve().parent / ".cache" / "llm"
+_LLM_CACHE_ENABLED = bool(os.environ.get("PAPERCUTTER_LLM_CACHE"))
+# 大模型输出中的代码块标记（```json ... ```）
+_CODE_FENCE_SEARCH = re.compile(r"```(?:json)?\s*([\s\S]*?)```").search
+# 文本内嵌图片引用：<img src="...">、<img src='...'>、![alt](...)，合并为一个正则单次扫描
+_RE_IMG_ALL = re.compile(
+    r"""(?P<html><img\b[^>]*\bsrc\s*=\s*)(?:"(?P<dq>[^"]+)"|'(?P<sq>[^']+)')"""
+    r"""|(?P<md>!\[[^\]]*\]\()(?P<mpath>[^)]+)\)""",
+    re.IGNORECASE,
+)
+# 序列化后 JSON 中残留的 "imgs/..." 字符串
+_RE_IMGS_QUOTED = re.compile(r'"(imgs/[^"]+)"')
+# 非空的 question_images / analysis_images 数组（其中可能是绝对路径或其他相对路径）
+_RE_NONEMPTY_IMAGE_LIST = re.compile(r'"(?:question|analysis)_images"\s*:\s*\[\s*[^\]\s]')
+# 超过 19 位的裸整数：orjson 会静默转为 float 丢失精度，含此类数值的 JSON 改用标准库解析
+_RE_LONG_INT = re.compile(r"(?:^|[:\[,])\s*-?\d{20,}")
+
 
 def _init_pipeline() -> PaddleOCRVL:
     """
@@ -59,6 +134,26 @@ def _init_pipeline() -> PaddleOCRVL:
         return _PIPELINE_INSTANCE
 
 
+def prewarm() -> threading.Thread:
+    """
+    在后台守护线程中提前初始化 PaddleOCRVL 管线，使模型加载与参数解析、文件上传等工作重叠。
+
+    初始化期间其他调用方会在 _PIPELINE_LOCK 上等待，直到后台加载完成后复用同一实例；
+    若后台初始化失败，后续调用 _init_pipeline 时会重新尝试。
+
+    Returns:
+        threading.Thread: 已启动的预热线程
+    """
+    t = threading.Thread(target=_init_pipeline, name="paddleocr-vl-prewarm", daemon=True)
+    t.start()
+    return t
+
+
+# 设置 PAPERCUTTER_PREWARM 环境变量时，在模块导入阶段即开始后台加载模型
+if os.environ.get("PAPERCUTTER_PREWARM"):
+    prewarm()
+
+
 def _is_pdf(p: Path) -> bool:
     """
     判断路径是否为 PDF 文件。
@@ -82,8 +177,7 @@ def _is_image(p: Path) -> bool:
     Returns:
         bool: 如果文件扩展名为常见图片格式（.png, .jpg, .jpeg, .bmp, .tif, .tiff, .webp）则返回 True，否则返回 False
     """
-    exts = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
-    return p.suffix.lower() in exts
+    return p.suffix.lower() in _IMAGE_EXTS
 
 
 def _collect_images_from_dir(d: Path) -> List[Path]:
@@ -96,122 +190,270 @@ def _collect_images_from_dir(d: Path) -> List[Path]:
     Returns:
         List[Path]: 目录中所有图片文件的路径列表，按字母顺序排序
     """
-    exts = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
-    return sorted([p for p in d.iterdir() if p.is_file() and p.suffix.lower() in exts])
+    # os.scandir 的 DirEntry 自带文件类型信息，无需对每个条目额外 stat
+    with os.scandir(d) as it:
+        return sorted(
+            d / e.name for e in it
+            if os.path.splitext(e.name)[1].lower() in _IMAGE_EXTS and e.is_file()
+        )
+
+
+def _gpu_decode_rgb(p: Path):
+    """
+    使用 nvImageCodec 在 GPU 上解码图片（nvJPEG 等硬件解码），再拷回主机内存供管线使用。
+    解码器初始化失败（如无可用 CUDA 设备）时在本进程内关闭 GPU 解码。
+
+    Args:
+        p (Path): 图片文件路径
+
+    Returns:
+        RGB 格式的 ndarray；GPU 解码不可用或失败时返回 None
+    """
+    global _GPU_DECODE
+    decoder = getattr(_GPU_DECODER_LOCAL, "decoder", None)
+    if decoder is None:
+        try:
+            decoder = _GPU_DECODER_LOCAL.decoder = nvimgcodec.Decoder()
+        except Exception as e:
+            _GPU_DECODE = False
+            logger.warning(f"GPU 图片解码不可用，改用 OpenCV 解码 ({e})")
+            return None
+    try:
+        img = decoder.read(str(p))
+        if img is None:
+            return None
+        return np.asarray(img.cpu())
+    except Exception as e:
+        logger.warning(f"GPU 解码失败，改用 OpenCV 解码: {p} ({e})")
+        return None
+
+
+def _decode_rgb(p: Path):
+    """
+    读取图片并转换为 RGB 格式的 ndarray。
+
+    Args:
+        p (Path): 图片文件路径
+
+    Returns:
+        RGB 格式的 ndarray；无法解码时返回 None
+    """
+    if _GPU_DECODE:
+        img = _gpu_decode_rgb(p)
+        if img is not None:
+            return img
+    if _IMREAD_COLOR_RGB is not None:
+        # 直接解码为 RGB，省去一次整帧的颜色转换与内存拷贝
+        img = cv2.imread(str(p), _IMREAD_COLOR_RGB)
+    else:
+        img = cv2.imread(str(p))
+        if img is not None:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if img is None:
+        logger.warning(f"图片无法解码，已跳过: {p}")
+    return img
+
+
+def _iter_decoded_images(image_paths: List[Path]):
+    """
+    按原顺序逐张产出解码后的 RGB 图片，同时在后台线程池中预取后续图片。
+    - 预取数量有界，主线程推理当前图片时，后续图片的读取与解码并行进行
+    - 无法解码的图片直接跳过
+
+    Args:
+        image_paths (List[Path]): 图片文件路径列表
+
+    Yields:
+        RGB 格式的 ndarray
+    """
+    paths = iter(image_paths)
+    with ThreadPoolExecutor(max_workers=_DECODE_WORKERS) as pool:
+        pending = deque(pool.submit(_decode_rgb, p) for p in islice(paths, _DECODE_WORKERS + 1))
+        while pending:
+            img = pending.popleft().result()
+            nxt = next(paths, None)
+            if nxt is not None:
+                pending.append(pool.submit(_decode_rgb, nxt))
+            if img is not None:
+                yield img
+
+
+def _predict_images(pipeline: PaddleOCRVL, image_paths: List[Path]):
+    """
+    分批调用管线推理一组图片，按原顺序逐页产出预测结果。
+    - 每次将至多 _PREDICT_BATCH_SIZE 张已解码图片一并传给 pipeline.predict，摊薄单次调用开销
+    - 分批而非整目录一次性传入，内存占用与目录大小无关
+
+    Args:
+        pipeline (PaddleOCRVL): OCR视觉语言处理管线对象
+        image_paths (List[Path]): 待处理的图片文件路径列表
+
+    Yields:
+        管线输出的单页预测结果
+    """
+    imgs = _iter_decoded_images(image_paths)
+    while True:
+        batch = list(islice(imgs, _PREDICT_BATCH_SIZE))
+        if not batch:
+            return
+        yield from pipeline.predict(batch)
+
+
+def _save_image(save_path: Path, image) -> None:
+    """
+    将单张图片对象保存到指定路径，必要时创建父目录。
+    """
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    image.save(save_path)
 
 
 def _save_markdown_images(items: List[Dict[str, "object"]], output_dir: Path) -> None:
     """
     将 Markdown 聚合信息中记录的图片对象保存到输出目录的相对路径位置。
+    - 使用线程池并行编码与写盘（PIL 编码时释放 GIL）
 
     Args:
         items (List[Dict[str, "object"]]): 包含图片对象的列表，每个元素为 {relative_path: PIL.Image} 的字典
         output_dir (Path): 输出目录路径
     """
-    for item in items:
-        if not item:
-            continue
-        # 遍历每个图片项，保存到对应的相对路径位置
-        for rel_path, image in item.items():
-            save_path = output_dir / rel_path
-            # 创建必要的父目录
-            save_path.parent.mkdir(parents=True, exist_ok=True)
-            image.save(save_path)
+    # 按保存路径去重，同一路径以最后出现的图片为准，避免并发写同一文件
+    jobs = {output_dir / rel_path: image for item in items if item for rel_path, image in item.items()}
+    if not jobs:
+        return
+    with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4, len(jobs))) as pool:
+        futures = [pool.submit(_save_image, save_path, image) for save_path, image in jobs.items()]
+        for fut in futures:
+            fut.result()
 
 
-def _process_pdf(pipeline: PaddleOCRVL, pdf_path: Path, output_dir: Path) -> Path:
+def _extend_markdown(results, markdown_list: List[Dict], markdown_images: List[Dict]) -> None:
     """
-    处理单个 PDF 文件：
-    - 调用管线预测，聚合多页 Markdown 文本
-    - 将对应的页面图片按相对路径保存到输出目录
-    - 返回生成的 Markdown 文件路径
+    从管线预测结果中提取每页的 Markdown 信息与页面图片，追加到对应列表。
 
     Args:
-        pipeline (PaddleOCRVL): OCR处理管线对象
-        pdf_path (Path): PDF文件的路径
-        output_dir (Path): 输出目录的路径
-
-    Returns:
-        Path: 生成的Markdown文件路径
+        results: 管线输出的预测结果序列
+        markdown_list (List[Dict]): 累计的 Markdown 页面信息列表
+        markdown_images (List[Dict]): 累计的页面图片字典列表
     """
-    output = pipeline.predict(input=str(pdf_path))
-    markdown_list = []
-    markdown_images = []
-
-    # 遍历输出结果，提取markdown文本和图片信息
-    for res in output:
+    for res in results:
         md = res.markdown
         markdown_list.append(md)
         markdown_images.append(md.get("markdown_images", {}))
 
-    # 拼接多页的markdown文本
-    texts = pipeline.concatenate_markdown_pages(markdown_list)
 
-    # 生成markdown文件路径并写入文件
-    md_path = output_dir / f"{pdf_path.stem}.md"
+def _namespace_markdown_images(
+        texts: str, markdown_images: List[Dict], image_subdir: str
+) -> Tuple[str, List[Dict]]:
+    """
+    把图片相对路径 imgs/xxx.jpg 改写为 imgs/<image_subdir>/xxx.jpg，并同步替换 Markdown 中的引用。
+    管线生成的裁剪图只以框坐标命名，多个页面共用同一 imgs 目录时需按页面分开存放，否则会互相覆盖。
+
+    Args:
+        texts (str): 合并后的 Markdown 文本
+        markdown_images (List[Dict]): 页面图片字典列表
+        image_subdir (str): 图片子目录名（通常为页面文件名去掉后缀）
+
+    Returns:
+        Tuple[str, List[Dict]]: 改写后的 Markdown 文本与图片字典列表
+    """
+    mapping = {}
+    renamed = []
+    for item in markdown_images:
+        new_item = {}
+        for rel_path, image in (item or {}).items():
+            head, _, name = rel_path.rpartition("/")
+            new_rel = f"{head}/{image_subdir}/{name}" if head else f"{image_subdir}/{name}"
+            mapping[rel_path] = new_rel
+            new_item[new_rel] = image
+        renamed.append(new_item)
+    if mapping:
+        # 长路径优先，单次扫描完成全部替换
+        pattern = re.compile("|".join(map(re.escape, sorted(mapping, key=len, reverse=True))))
+        texts = pattern.sub(lambda m: mapping[m.group(0)], texts)
+    return texts, renamed
+
+
+def _write_markdown(
+        pipeline: PaddleOCRVL, markdown_list: List[Dict], markdown_images: List[Dict], output_dir: Path,
+        markdown_filename: str, image_subdir: str | None = None
+) -> Tuple[Path, str]:
+    """
+    合并多页 Markdown 并写入文件，同时保存其中引用的图片。
+
+    Args:
+        pipeline (PaddleOCRVL): OCR视觉语言处理管线对象
+        markdown_list (List[Dict]): Markdown 页面信息列表
+        markdown_images (List[Dict]): 页面图片字典列表
+        output_dir (Path): 输出目录路径
+        markdown_filename (str): 生成的markdown文件名
+        image_subdir (str | None): 图片存放的子目录名，多份文档共用输出目录时用于避免图片重名覆盖
+
+    Returns:
+        Tuple[Path, str]: 生成的Markdown文件路径及其文本内容
+    """
+    # 合并所有markdown页面内容
+    texts = pipeline.concatenate_markdown_pages(markdown_list)
+    if image_subdir:
+        texts, markdown_images = _namespace_markdown_images(texts, markdown_images, image_subdir)
+    md_path = output_dir / markdown_filename
     with open(md_path, "w", encoding="utf-8") as f:
         f.write(texts)
 
     # 保存markdown中引用的图片
     _save_markdown_images(markdown_images, output_dir)
     logger.info("Markdown 文档生成完成")
-    return md_path
+    return md_path, texts
+
+
+def _process_pdf(pipeline: PaddleOCRVL, pdf_path: Path, output_dir: Path) -> Tuple[Path, str]:
+    """
+    处理单个 PDF 文件：
+    - 调用管线预测，聚合多页 Markdown 文本
+    - 将对应的页面图片按相对路径保存到输出目录
+    - 返回生成的 Markdown 文件路径及文本
+
+    Args:
+        pipeline (PaddleOCRVL): OCR处理管线对象
+        pdf_path (Path): PDF文件的路径
+        output_dir (Path): 输出目录的路径
+
+    Returns:
+        Tuple[Path, str]: 生成的Markdown文件路径及其文本内容
+    """
+    markdown_list = []
+    markdown_images = []
+    _extend_markdown(pipeline.predict(input=str(pdf_path)), markdown_list, markdown_images)
+    return _write_markdown(pipeline, markdown_list, markdown_images, output_dir, f"{pdf_path.stem}.md")
 
 
 def _process_images(
-        pipeline: PaddleOCRVL, image_paths: List[Path], output_dir: Path, markdown_filename: str
-) -> Path:
+        pipeline: PaddleOCRVL, image_paths: List[Path], output_dir: Path, markdown_filename: str,
+        image_subdir: str | None = None
+) -> Tuple[Path, str]:
     """
     处理一组图片（单张或多张）：
-    - 对每张图片调用管线预测并收集 Markdown 片段与页面图片
+    - 对图片分批调用管线预测并收集 Markdown 片段与页面图片
     - 合并为一个 Markdown 文件
-    - 返回生成的 Markdown 文件路径
+    - 返回生成的 Markdown 文件路径及文本
 
     Args:
         pipeline (PaddleOCRVL): OCR视觉语言处理管线对象
         image_paths (List[Path]): 待处理的图片文件路径列表
         output_dir (Path): 输出目录路径
         markdown_filename (str): 生成的markdown文件名
+        image_subdir (str | None): 图片存放的子目录名（imgs/<image_subdir>/），为 None 时直接放在 imgs/ 下
 
     Returns:
-        Path: 生成的Markdown文件的完整路径
+        Tuple[Path, str]: 生成的Markdown文件的完整路径及其文本内容
     """
     markdown_list = []
     markdown_images = []
-    for p in image_paths:
-        img = cv2.imread(str(p))
-        if img is None:
-            continue
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        output = pipeline.predict(img)
-        for res in output:
-            md = res.markdown
-            markdown_list.append(md)
-            markdown_images.append(md.get("markdown_images", {}))
-
-    # 合并所有markdown页面内容
-    texts = pipeline.concatenate_markdown_pages(markdown_list)
-    md_path = output_dir / markdown_filename
-    with open(md_path, "w", encoding="utf-8") as f:
-        f.write(texts)
-
-    # 保存markdown中引用的图片
-    _save_markdown_images(markdown_images, output_dir)
-    logger.info("Markdown 文档生成完成")
-    return md_path
+    _extend_markdown(_predict_images(pipeline, image_paths), markdown_list, markdown_images)
+    return _write_markdown(pipeline, markdown_list, markdown_images, output_dir, markdown_filename, image_subdir)
 
 
-def extract_content(text: str) -> str:
-    """
-    调用大模型从 Markdown 文本中抽取结构化 JSON 字符串。
-    - 使用 templates.json_data 作为严格的输出模板参考
-    - 仅返回纯 JSON 字符串（去除可能的代码块标记）
-    """
-    client = OpenAI(
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("LLM_MODEL_URL"),
-    )
-    system_prompt = f"""
+# 结构化抽取的系统提示词：模块加载时插值一次，保证每次请求的前缀完全一致，便于服务端前缀缓存命中
+_SYSTEM_PROMPT = f"""
         你是一个严格的结构化题目信息抽取助手。
         请从给定的 Markdown 文本中抽取题目信息，并【严格按照指定 JSON Schema 输出】。
         只输出 JSON，不允许任何解释、注释、代码块或多余文字。
@@ -308,23 +550,183 @@ def extract_content(text: str) -> str:
         3. 格式合法性校验：JSON 无尾逗号、无非法转义（如 \n 保留，不转为 \\n）、数组/对象闭合；
         4. 内容一致性校验：question_tables 与 question_content 中的表格一致，question_images 与题干中的图片路径一致，无重复/遗漏。
 
+"""
+
+
+def _get_llm_client() -> OpenAI:
+    """
+    获取全局共享的 OpenAI 兼容客户端，采用单例模式复用底层 HTTP 连接池
+
+    首次调用时加载环境变量并创建客户端，后续调用直接返回同一实例，
+    避免每次抽取都重新建立 TCP/TLS 连接。
+
+    Returns:
+        OpenAI: 全局共享的客户端实例
+    """
+    global _LLM_CLIENT
+    if _LLM_CLIENT is not None:
+        return _LLM_CLIENT
+    with _LLM_CLIENT_LOCK:
+        if _LLM_CLIENT is not None:
+            return _LLM_CLIENT
+        # 加载环境变量配置
+        load_dotenv()
+        _LLM_CLIENT = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("LLM_MODEL_URL"),
+            # 重试统一由 _llm_retry 负责，SDK 内部重试会绕过限速器
+            max_retries=0,
+        )
+        return _LLM_CLIENT
+
+
+def _new_async_llm_client() -> AsyncOpenAI:
+    """
+    创建一个新的异步客户端。
+    httpx 异步连接池绑定创建时的事件循环，因此不做全局单例：
+    每个事件循环各自创建，并以 async with 在该循环内关闭。
+
+    Returns:
+        AsyncOpenAI: 新建的异步客户端实例
+    """
+    # 加载环境变量配置
+    load_dotenv()
+    return AsyncOpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=os.getenv("LLM_MODEL_URL"),
+        # 重试统一由 _llm_retry 负责，SDK 内部重试会绕过限速器
+        max_retries=0,
+    )
+
+
+class _TokenBucket:
+    """
+    按每分钟额度限速的令牌桶，线程安全；同步线程与各事件循环中的协程共用同一个桶。
+    """
+
+    def __init__(self, per_minute: int):
+        self._capacity = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        取走 amount 个令牌并返回需要等待的秒数；令牌不足时预支，等待结束即视为已获得。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+            self._updated = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+
+
+class _LLMLimiter:
+    """
+    大模型请求限速器：同时按每分钟请求数（RPM）与每分钟 token 数（TPM）限速，未配置的一项不限制。
+    TPM 只按请求的输入估算（系统提示词 + 文本的字符数，中文约 1 字 1 token，作为上界），不包含模型输出。
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self._rpm = _TokenBucket(rpm) if rpm > 0 else None
+        self._tpm = _TokenBucket(tpm) if tpm > 0 else None
+
+    def _reserve(self, text: str) -> float:
+        delay = 0.0
+        if self._rpm is not None:
+            delay = max(delay, self._rpm.reserve())
+        if self._tpm is not None:
+            delay = max(delay, self._tpm.reserve(_estimate_tokens(text)))
+        return delay
+
+    def acquire(self, text: str) -> None:
+        delay = self._reserve(text)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire_async(self, text: str) -> None:
+        delay = self._reserve(text)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def _estimate_tokens(text: str) -> int:
+    """
+    估算一次抽取请求的输入 token 数，用于 TPM 限速。
+    """
+    return len(_SYSTEM_PROMPT) + len(text)
+
+
+def _env_positive_int(name: str) -> int:
+    """
+    读取正整数环境变量，未设置或不是整数时返回 0（不限制）。
+    """
+    try:
+        return max(0, int(os.getenv(name) or 0))
+    except ValueError:
+        logger.warning(f"{name} 不是整数，已忽略: {os.getenv(name)}")
+        return 0
+
+
+def _get_llm_limiter() -> _LLMLimiter | None:
+    """
+    获取全局限速器：环境变量 LLM_MAX_RPM / LLM_MAX_TPM 为正整数时分别按每分钟请求数 / token 数限速，均未设置时不限速。
+
+    Returns:
+        _LLMLimiter | None: 全局共享的限速器，不限速时为 None
+    """
+    global _LLM_LIMITER
+    if _LLM_LIMITER is not None:
+        return _LLM_LIMITER or None
+    with _LLM_LIMITER_LOCK:
+        if _LLM_LIMITER is None:
+            # 加载环境变量配置（LLM_MAX_RPM / LLM_MAX_TPM 可写在 .env 中）
+            load_dotenv()
+            rpm = _env_positive_int("LLM_MAX_RPM")
+            tpm = _env_positive_int("LLM_MAX_TPM")
+            # 不限速时以 False 占位，避免每次调用都重新读取环境变量
+            _LLM_LIMITER = _LLMLimiter(rpm, tpm) if rpm or tpm else False
+    return _LLM_LIMITER or None
+
+
+def _log_llm_retry(retry_state) -> None:
+    logger.warning(
+        f"大模型请求失败，{retry_state.next_action.sleep:.1f}s 后第 {retry_state.attempt_number + 1} 次尝试: "
+        f"{retry_state.outcome.exception()!r}"
+    )
+
+
+# 限流（429）与连接错误按带抖动的指数退避重试，最多 6 次，仍失败则抛出原异常
+_llm_retry = retry(
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError)),
+    wait=wait_random_exponential(min=1, max=60),
+    stop=stop_after_attempt(6),
+    before_sleep=_log_llm_retry,
+    reraise=True,
+)
+
+
+def _build_messages(text: str) -> List[Dict[str, str]]:
+    """
+    构造结构化抽取请求的消息列表：固定的系统提示词 + 待抽取的 Markdown 文本。
     """
     user_prompt = """
     请从以下文本中提取出用户感兴趣的内容：
     """ + text
-    response = client.chat.completions.create(
-        model=os.getenv("LLM_MODEL_NAME"),
-        # model="qwen3-next-80b-a3b-instruct",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        extra_body={"chat_template_kwargs": {"enable_thinking": False}},
-    )
-    content = response.choices[0].message.content
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _strip_code_fence(content: str) -> str:
+    """
+    去除大模型输出中可能包裹 JSON 的代码块标记，返回纯 JSON 字符串。
+    """
     try:
-        import re
-        m = re.search(r"```(?:json)?\s*([\s\S]*?)```", content)
+        m = _CODE_FENCE_SEARCH(content)
         if m:
             return m.group(1).strip()
         return content.strip()
@@ -332,19 +734,221 @@ def extract_content(text: str) -> str:
         return content
 
 
-def _to_base64(fp: str) -> str:
+def _llm_cache_path(text: str) -> Path:
+    """
+    计算抽取结果的缓存文件路径：键由系统提示词、模型名与输入文本共同决定，
+    模板（json_data）或 LLM_MODEL_NAME 变化时自动失效。
+    """
+    h = hashlib.blake2b(digest_size=32)
+    h.update(_SYSTEM_PROMPT.encode("utf-8"))
+    h.update(b"\0")
+    h.update((os.getenv("LLM_MODEL_NAME") or "").encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return _LLM_CACHE_DIR / f"{h.hexdigest()}.json"
+
+
+def enable_llm_cache(enabled: bool = True) -> None:
+    """
+    开启或关闭大模型抽取结果的磁盘缓存（当前进程内生效）。
+    面向会对同一批数据反复重跑的批处理脚本；在线服务不应开启，缓存没有淘汰机制。
+    """
+    global _LLM_CACHE_ENABLED
+    _LLM_CACHE_ENABLED = enabled
+
+
+def _llm_cache_get(text: str) -> str | None:
+    """
+    读取缓存的抽取结果，未命中或缓存关闭时返回 None。
+    """
+    if not _LLM_CACHE_ENABLED:
+        return None
+    try:
+        return _llm_cache_path(text).read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+
+def _llm_cache_put(text: str, content: str) -> None:
     """
-    将本地文件读取为 base64 编码字符串（ASCII）。
+    写入抽取结果：先写临时文件再 os.replace，并发写同一键时不会留下半截文件。
+    只缓存可解析的 JSON，截断或格式错误的输出在重跑时会重新请求；缓存写失败只记录日志，不影响本次结果。
+    """
+    if not _LLM_CACHE_ENABLED or not content:
+        return
+    try:
+        _json_loads(content)
+    except ValueError:
+        return
+    path = _llm_cache_path(text)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+    except OSError as e:
+        logger.warning(f"抽取结果缓存写入失败: {e}")
+
+
+def extract_content(text: str) -> str:
+    """
+    调用大模型从 Markdown 文本中抽取结构化 JSON 字符串。
+    - 使用 templates.json_data 作为严格的输出模板参考
+    - 仅返回纯 JSON 字符串（去除可能的代码块标记）
+    """
+    client = _get_llm_client()
+    cached = _llm_cache_get(text)
+    if cached is not None:
+        return cached
+    content = _strip_code_fence(_complete(client, text))
+    _llm_cache_put(text, content)
+    return content
+
+
+@_llm_retry
+def _complete(client: OpenAI, text: str) -> str:
+    """
+    发起一次流式抽取请求并返回模型原始输出；每次尝试（含重试）都先从限速器取令牌。
+    """
+    limiter = _get_llm_limiter()
+    if limiter is not None:
+        limiter.acquire(text)
+    # 流式接收输出，边生成边读取，避免长输出在服务端整体缓冲后才返回
+    stream = client.chat.completions.create(
+        model=os.getenv("LLM_MODEL_NAME"),
+        # model="qwen3-next-80b-a3b-instruct",
+        messages=_build_messages(text),
+        extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+        stream=True,
+    )
+    buf = io.StringIO()
+    for chunk in stream:
+        if chunk.choices:
+            buf.write(chunk.choices[0].delta.content or "")
+    return buf.getvalue()
+
+
+async def extract_content_async(text: str, client: AsyncOpenAI) -> str:
+    """
+    extract_content 的异步版本，使用调用方提供的 AsyncOpenAI 客户端发起请求。
 
     Args:
-        fp (str): 本地文件路径
+        text (str): 待抽取的 Markdown 文本
+        client (AsyncOpenAI): 异步客户端，同一批次内共享连接池
+
+    Returns:
+        str: 纯 JSON 字符串
+    """
+    cached = _llm_cache_get(text)
+    if cached is not None:
+        return cached
+    content = _strip_code_fence(await _complete_async(client, text))
+    _llm_cache_put(text, content)
+    return content
+
+
+@_llm_retry
+async def _complete_async(client: AsyncOpenAI, text: str) -> str:
+    """
+    _complete 的异步版本：限速等待与退避重试均不阻塞事件循环。
+    """
+    limiter = _get_llm_limiter()
+    if limiter is not None:
+        await limiter.acquire_async(text)
+    stream = await client.chat.completions.create(
+        model=os.getenv("LLM_MODEL_NAME"),
+        messages=_build_messages(text),
+        extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+        stream=True,
+    )
+    buf = io.StringIO()
+    async for chunk in stream:
+        if chunk.choices:
+            buf.write(chunk.choices[0].delta.content or "")
+    return buf.getvalue()
+
+
+def extract_content_many(texts: List[str], concurrency: int = 20, return_exceptions: bool = False) -> List:
+    """
+    并发地对多份 Markdown 文本执行结构化抽取，结果顺序与输入一致。
+    - 请求通过 asyncio.gather 并发发出，信号量限制同时在途的请求数，避免触发服务端限流
+    - 异步客户端在本次事件循环内创建并关闭（httpx 异步连接池不能跨事件循环复用）
+    - 不可在已运行的事件循环中直接调用（如 FastAPI 协程内），此时应放入线程执行
+
+    Args:
+        texts (List[str]): 待抽取的 Markdown 文本列表
+        concurrency (int): 同时在途的最大请求数，默认为20
+        return_exceptions (bool): 为 True 时单个请求的异常作为对应位置的结果返回，而不是中断整批
+
+    Returns:
+        List: 与输入一一对应的纯 JSON 字符串列表（return_exceptions 为 True 时可能包含异常对象）
+    """
+
+    async def _run() -> List:
+        sem = asyncio.Semaphore(max(1, concurrency))
+        async with _new_async_llm_client() as client:
+            async def _bound(text: str) -> str:
+                async with sem:
+                    return await extract_content_async(text, client)
+
+            return list(await asyncio.gather(*(_bound(t) for t in texts), return_exceptions=return_exceptions))
+
+    return asyncio.run(_run())
+
+
+def _fd_base64(fd: int, size: int) -> str:
+    """
+    将已打开的文件描述符的内容编码为 base64 字符串（ASCII）。
+
+    Args:
+        fd (int): 以只读方式打开的文件描述符，由调用方负责关闭
+        size (int): 文件大小（字节），取自调用方已有的 fstat 结果
 
     Returns:
         str: base64编码的ASCII字符串
     """
-    # 以二进制模式打开文件并读取内容，然后进行base64编码并解码为ASCII字符串
-    with open(fp, "rb") as f:
-        return base64.b64encode(f.read()).decode("ascii")
+    # 空文件无法 mmap
+    if size == 0:
+        return ""
+    # 常规大小的文件以只读方式 mmap 后一次性编码，避免先把整个文件复制为 bytes 对象
+    if size < _MMAP_MAX_SIZE:
+        with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+            return binascii.b2a_base64(mm, newline=False).decode("ascii")
+    # 超大文件分块流式编码，块大小为 3 的倍数，块间不会产生填充字符
+    parts = []
+    with open(fd, "rb", closefd=False) as f:
+        while chunk := f.read(_B64_CHUNK_SIZE):
+            parts.append(binascii.b2a_base64(chunk, newline=False))
+    return b"".join(parts).decode("ascii")
+
+
+def _file_base64(fp: str) -> str | None:
+    """
+    读取普通文件的 base64 编码。
+    只打开一次文件：os.open 后由 fstat 结果同时判断是否为普通文件并取得大小，共 open + fstat 两次系统调用。
+
+    Args:
+        fp (str): 本地文件路径
+
+    Returns:
+        str | None: base64编码的ASCII字符串；路径不存在、无法打开或不是普通文件时返回 None
+    """
+    try:
+        fd = os.open(fp, _OPEN_RDONLY_FLAGS)
+    except OSError:
+        return None
+    try:
+        st = os.fstat(fd)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return _fd_base64(fd, st.st_size)
+    finally:
+        os.close(fd)
 
 
 def _convert_paths(paths, base_dir: str, cache: Dict[str, str] | None = None, to_delete: Set[str] | None = None):
@@ -364,6 +968,8 @@ def _convert_paths(paths, base_dir: str, cache: Dict[str, str] | None = None, to
         转换后的路径列表，本地图片路径被转换为base64格式，其他路径保持不变
     """
     result = []
+    # 需要读盘编码的路径：完整路径 -> 其在 result 中的下标列表（同一路径只编码一次）
+    pending: Dict[str, List[int]] = {}
     for p in paths:
         if not isinstance(p, str):
             result.append(p)
@@ -374,132 +980,188 @@ def _convert_paths(paths, base_dir: str, cache: Dict[str, str] | None = None, to
             continue
         # 构建完整路径，绝对路径直接使用，相对路径与base_dir拼接
         full = p if os.path.isabs(p) else os.path.join(base_dir, p)
-        # 检查文件是否存在
-        if os.path.isfile(full):
-            # 检查缓存中是否已有该文件的base64编码
-            if cache is not None and full in cache:
-                b64 = cache[full]
-            else:
-                # 转换文件为base64并更新缓存
-                b64 = _to_base64(full)
-                if cache is not None:
-                    cache[full] = b64
-                # 记录需要删除的文件路径
-                if to_delete is not None:
-                    to_delete.add(full)
-            result.append(b64)
-        else:
-            # 文件不存在则保留原路径
-            result.append(p)
+        # 检查缓存中是否已有该文件的base64编码
+        if cache is not None and full in cache:
+            result.append(cache[full])
+            continue
+        pending.setdefault(full, []).append(len(result))
+        result.append(p)
+
+    if not pending:
+        return result
+
+    # 多个文件时并行读盘编码（文件读取与 base64 编码均释放 GIL）
+    fulls = list(pending)
+    if len(fulls) > 1:
+        with ThreadPoolExecutor(max_workers=min(_B64_WORKERS, len(fulls))) as ex:
+            encoded = list(ex.map(_file_base64, fulls))
+    else:
+        encoded = [_file_base64(fulls[0])]
+
+    for full, b64 in zip(fulls, encoded):
+        # 文件不存在则保留原路径
+        if b64 is None:
+            continue
+        if cache is not None:
+            cache[full] = b64
+        # 记录需要删除的文件路径
+        if to_delete is not None:
+            to_delete.add(full)
+        for i in pending[full]:
+            result[i] = b64
     return result
 
 
-def _transform_item(item, base_dir: str, cache: Dict[str, str] | None = None, to_delete: Set[str] | None = None):
+def _mime_from_ext(fp: str) -> str:
+    """
+    根据文件扩展名返回对应的图片 MIME 类型，未知扩展名返回 application/octet-stream。
     """
-    对单个题目项进行转换：
-    - question_images / analysis_images 转为 base64
-    - 递归处理 sub_questions
+    return _EXT_MIME.get(os.path.splitext(fp)[1].lower(), "application/octet-stream")
 
-    Args:
-        item: 待转换的题目项，可以是字典或其他类型
-        base_dir (str): 基础目录路径，用于文件路径转换
-        cache (Dict[str, str] | None): 缓存字典，用于存储已转换的路径映射关系，默认为None
-        to_delete (Set[str] | None): 待删除的文件路径集合，默认为None
 
-    Returns:
-        转换后的题目项，如果输入不是字典则直接返回原值
-    """
-    if not isinstance(item, dict):
-        return item
-    # 处理题目图片列表，将路径转换为base64格式
-    if "question_images" in item and isinstance(item["question_images"], list):
-        item["question_images"] = _convert_paths(item["question_images"], base_dir, cache, to_delete)
-    # 处理解析图片列表，将路径转换为base64格式
-    if "analysis_images" in item and isinstance(item["analysis_images"], list):
-        item["analysis_images"] = _convert_paths(item["analysis_images"], base_dir, cache, to_delete)
-    # 递归处理子题目列表
-    if "sub_questions" in item and isinstance(item["sub_questions"], list):
-        item["sub_questions"] = [_transform_item(x, base_dir, cache, to_delete) for x in item["sub_questions"]]
-    return item
+def _inline_convert_path(path: str, base_dir: str, cache: Dict[str, str] | None = None,
+                         to_delete: Set[str] | None = None) -> str:
+    """
+    将文本中引用的单个本地图片路径转换为 data URI；网络路径、data URI 与不存在的文件保持原样。
+    """
+    if not isinstance(path, str):
+        return path
+    if path.startswith("http://") or path.startswith("https://") or path.startswith("data:"):
+        return path
+    full = path if os.path.isabs(path) else os.path.join(base_dir, path)
+    if cache is not None and full in cache:
+        b64 = cache[full]
+    else:
+        b64 = _file_base64(full)
+        if b64 is None:
+            return path
+        if cache is not None:
+            cache[full] = b64
+    if to_delete is not None:
+        to_delete.add(full)
+    mime = _mime_from_ext(full)
+    return f"data:{mime};base64,{b64}"
 
 
-def _mime_from_ext(fp: str) -> str:
-    ext = os.path.splitext(fp)[1].lower()
-    if ext in {".jpg", ".jpeg"}:
-        return "image/jpeg"
-    if ext == ".png":
-        return "image/png"
-    if ext == ".webp":
-        return "image/webp"
-    if ext in {".bmp"}:
-        return "image/bmp"
-    if ext in {".gif"}:
-        return "image/gif"
-    if ext in {".tif", ".tiff"}:
-        return "image/tiff"
-    return "application/octet-stream"
+def _inline_replace(m: re.Match, base_dir: str, cache: Dict[str, str] | None = None,
+                    to_delete: Set[str] | None = None) -> str:
+    """
+    图片引用正则的替换回调：仅转换 imgs/ 开头或绝对路径的图片，其余原样返回。
+    """
+    if m.group("html") is not None:
+        # HTML 图片标签，保留原有的引号类型
+        path, quote = m.group("dq"), '"'
+        if path is None:
+            path, quote = m.group("sq"), "'"
+        pre, post = m.group("html") + quote, quote
+    else:
+        # Markdown 图片语法
+        path, pre, post = m.group("mpath"), m.group("md"), ")"
+    if path.startswith("imgs/") or os.path.isabs(path):
+        return pre + _inline_convert_path(path, base_dir, cache, to_delete) + post
+    return m.group(0)
+
+
+def _quoted_path_to_base64(m: re.Match, base_dir: str) -> str:
+    """
+    "imgs/..." 字符串的替换回调：文件存在时替换为带引号的 base64，否则保留原路径。
+    """
+    rel = m.group(1)
+    full = rel if os.path.isabs(rel) else os.path.join(base_dir, rel)
+    b64 = _file_base64(full)
+    if b64 is not None:
+        return '"' + b64 + '"'
+    return '"' + rel + '"'
 
 
 def _inline_convert_images_in_text(s: str, base_dir: str, cache: Dict[str, str] | None = None,
                                    to_delete: Set[str] | None = None) -> str:
-    try:
-        import re
-        def _convert_path(path: str) -> str:
-            if not isinstance(path, str):
-                return path
-            if path.startswith("http://") or path.startswith("https://") or path.startswith("data:"):
-                return path
-            full = path if os.path.isabs(path) else os.path.join(base_dir, path)
-            if os.path.isfile(full):
-                if cache is not None and full in cache:
-                    b64 = cache[full]
-                else:
-                    b64 = _to_base64(full)
-                    if cache is not None:
-                        cache[full] = b64
-                if to_delete is not None:
-                    to_delete.add(full)
-                mime = _mime_from_ext(full)
-                return f"data:{mime};base64,{b64}"
-            return path
-
-        def _html_double(m):
-            pre, path, post = m.group(1), m.group(2), m.group(3)
-            if path.startswith("imgs/") or os.path.isabs(path):
-                return pre + _convert_path(path) + post
-            return m.group(0)
-
-        def _html_single(m):
-            pre, path, post = m.group(1), m.group(2), m.group(3)
-            if path.startswith("imgs/") or os.path.isabs(path):
-                return pre + _convert_path(path) + post
-            return m.group(0)
-
-        def _markdown(m):
-            pre, path, post = m.group(1), m.group(2), m.group(3)
-            if path.startswith("imgs/") or os.path.isabs(path):
-                return pre + _convert_path(path) + post
-            return m.group(0)
-
-        s = re.sub(r'(<img\b[^>]*\bsrc\s*=\s*")([^"]+)(")', _html_double, s, flags=re.IGNORECASE)
-        s = re.sub(r"(<img\b[^>]*\bsrc\s*=\s*')([^']+)(')", _html_single, s, flags=re.IGNORECASE)
-        s = re.sub(r'(!\[[^\]]*\]\()([^)]+)(\))', _markdown, s)
+    # 既无 HTML 标签也无 Markdown 图片语法时无需进入正则
+    if "<" not in s and "![" not in s:
         return s
+    try:
+        repl = partial(_inline_replace, base_dir=base_dir, cache=cache, to_delete=to_delete)
+        return _RE_IMG_ALL.sub(repl, s)
     except Exception:
         return s
 
 
-def _transform_strings(value, base_dir: str, cache: Dict[str, str] | None = None, to_delete: Set[str] | None = None):
-    if isinstance(value, str):
-        return _inline_convert_images_in_text(value, base_dir, cache, to_delete)
-    if isinstance(value, list):
-        return [_transform_strings(x, base_dir, cache, to_delete) for x in value]
-    if isinstance(value, dict):
-        return {k: _transform_strings(v, base_dir, cache, to_delete) for k, v in value.items()}
-    return value
+def _transform_json(data, base_dir: str, cache: Dict[str, str] | None = None, to_delete: Set[str] | None = None):
+    """
+    一次遍历完成整个 JSON 值的图片转换：
+    - 题目项（顶层对象及 sub_questions 中的对象）的 question_images / analysis_images 转为 base64
+    - 所有字符串中内嵌的图片路径转换为 data URI
+    - 使用显式栈迭代遍历，原地修改容器，避免递归与重建 dict/list
 
+    Args:
+        data: 待转换的 JSON 值（列表、字典、字符串或其他类型）
+        base_dir (str): 基础目录路径，用于拼接相对路径
+        cache (Dict[str, str] | None): 缓存字典，用于存储已转换的路径映射关系，默认为None
+        to_delete (Set[str] | None): 待删除的文件路径集合，默认为None
+
+    Returns:
+        转换后的值；容器类型为原对象本身
+    """
+    if isinstance(data, str):
+        return _inline_convert_images_in_text(data, base_dir, cache, to_delete)
+    if not isinstance(data, (list, dict)):
+        return data
+    # 栈元素为 (容器, 标记)：dict 的标记表示其本身为题目项，list 的标记表示其 dict 元素为题目项
+    stack = deque([(data, True)])
+    while stack:
+        node, is_item = stack.pop()
+        if isinstance(node, dict):
+            if is_item:
+                # 处理题目图片与解析图片列表，将路径转换为base64格式
+                for key in ("question_images", "analysis_images"):
+                    if isinstance(node.get(key), list):
+                        node[key] = _convert_paths(node[key], base_dir, cache, to_delete)
+            for key, child in node.items():
+                if isinstance(child, str):
+                    node[key] = _inline_convert_images_in_text(child, base_dir, cache, to_delete)
+                elif isinstance(child, dict):
+                    stack.append((child, False))
+                elif isinstance(child, list):
+                    stack.append((child, is_item and key == "sub_questions"))
+        else:
+            for idx, child in enumerate(node):
+                if isinstance(child, str):
+                    node[idx] = _inline_convert_images_in_text(child, base_dir, cache, to_delete)
+                elif isinstance(child, dict):
+                    stack.append((child, is_item))
+                elif isinstance(child, list):
+                    stack.append((child, False))
+    return data
 
-def convert_images_in_json(json_input: str, base_dir: str = ".") -> str:
+
+def _json_loads(s: str) -> Tuple["object", bool]:
+    """
+    解析 JSON 文本，默认使用 orjson。
+    orjson 会把超过 19 位的整数静默转为 float，且比标准库严格（如不接受 NaN/Infinity），
+    遇到这两种情况改用标准库解析。
+
+    Returns:
+        Tuple[object, bool]: (解析结果, 是否由标准库解析)；标准库也无法解析时抛出 ValueError
+    """
+    if _RE_LONG_INT.search(s) is None:
+        try:
+            return orjson.loads(s), False
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s), True
+
+
+def _json_dumps(data, from_stdlib: bool) -> str:
+    """
+    序列化为紧凑的 UTF-8 JSON 文本，不转义非 ASCII 字符。
+    由标准库解析的数据也用标准库序列化，保留大整数与 NaN/Infinity（orjson 会写成 null）。
+    """
+    if from_stdlib:
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    return orjson.dumps(data).decode("utf-8")
+
+
+def convert_images_in_json(json_input: str, base_dir: str = ".", embed_images: bool = True) -> str:
     """
     将 JSON 字符串中的图片路径批量转换为 base64 字符串。
     支持顶层对象为列表或字典；解析失败时返回原始输入。
@@ -507,25 +1169,26 @@ def convert_images_in_json(json_input: str, base_dir: str = ".") -> str:
     参数:
         json_input (str): 包含图片路径的JSON字符串
         base_dir (str): 图片文件的基础目录，默认为当前目录
+        embed_images (bool): 为 False 时保留相对路径、不读取也不删除图片文件，由 JSON 的使用方按 base_dir 自行解析
 
     返回:
         str: 将图片路径替换为base64编码后的JSON字符串
     """
+    # 不内嵌图片时无需解析与遍历，原样返回
+    if not embed_images:
+        return json_input
+    # 既无 imgs/ 路径、<img> 标签、Markdown 图片语法，也没有非空的图片数组时，
+    # 不可能引用本地图片，无需解析与遍历，原样返回
+    if ("imgs/" not in json_input and "<img" not in json_input and "](" not in json_input
+            and _RE_NONEMPTY_IMAGE_LIST.search(json_input) is None):
+        return json_input
     try:
-        data = json.loads(json_input)
-    except json.JSONDecodeError:
+        data, from_stdlib = _json_loads(json_input)
+    except ValueError:
+        # 标准库也无法解析时按纯文本处理
         try:
-            import re
             s = _inline_convert_images_in_text(json_input, base_dir)
-
-            def _to_b64_text(m):
-                rel = m.group(1)
-                full = rel if os.path.isabs(rel) else os.path.join(base_dir, rel)
-                if os.path.isfile(full):
-                    return '"' + _to_base64(full) + '"'
-                return '"' + rel + '"'
-
-            return re.sub(r'"(imgs/[^"]+)"', _to_b64_text, s)
+            return _RE_IMGS_QUOTED.sub(partial(_quoted_path_to_base64, base_dir=base_dir), s)
         except Exception:
             return json_input
 
@@ -533,30 +1196,20 @@ def convert_images_in_json(json_input: str, base_dir: str = ".") -> str:
     to_delete: Set[str] = set()
 
     # 根据数据类型处理图片路径转换
-    if isinstance(data, list):
-        data = [_transform_item(x, base_dir, cache, to_delete) for x in data]
-        data = [_transform_strings(x, base_dir, cache, to_delete) for x in data]
-    elif isinstance(data, dict):
-        data = _transform_item(data, base_dir, cache, to_delete)
-        data = _transform_strings(data, base_dir, cache, to_delete)
+    if isinstance(data, (list, dict)):
+        data = _transform_json(data, base_dir, cache, to_delete)
 
-    s = json.dumps(data, ensure_ascii=False)
+    s = _json_dumps(data, from_stdlib)
 
-    # 检查转换后的字符串中是否还有未处理的图片路径，如有则用正则表达式处理
-    try:
-        import re
-        if "imgs/" in s:
-            def _to_b64_text(m):
-                rel = m.group(1)
-                full = rel if os.path.isabs(rel) else os.path.join(base_dir, rel)
-                if os.path.isfile(full):
-                    return '"' + _to_base64(full) + '"'
-                return '"' + rel + '"'
-
-            s = re.sub(r'"(imgs/[^"]+)"', _to_b64_text, s)
-        s = _inline_convert_images_in_text(s, base_dir, cache, to_delete)
-    except Exception:
-        pass
+    # 遍历已覆盖所有字符串，仅当序列化结果中仍残留本地图片路径时才用正则表达式补充处理
+    needs_rescan = "imgs/" in s or "<img" in s
+    if needs_rescan:
+        try:
+            if "imgs/" in s:
+                s = _RE_IMGS_QUOTED.sub(partial(_quoted_path_to_base64, base_dir=base_dir), s)
+            s = _inline_convert_images_in_text(s, base_dir, cache, to_delete)
+        except Exception:
+            pass
 
     # 清理临时文件
     try:
@@ -569,6 +1222,42 @@ def convert_images_in_json(json_input: str, base_dir: str = ".") -> str:
         return s
 
 
+def _process_mixed(pipeline: PaddleOCRVL, input_paths: List[str], output_dir: Path) -> Tuple[Path, str]:
+    """
+    处理路径列表（图片/目录/PDF 混合），将所有页面按输入顺序合并为一个 Markdown 文件。
+
+    Args:
+        pipeline (PaddleOCRVL): OCR视觉语言处理管线对象
+        input_paths (List[str]): 输入路径列表
+        output_dir (Path): 输出目录路径
+
+    Returns:
+        Tuple[Path, str]: 生成的Markdown文件路径及其文本内容
+    """
+    paths = [Path(x) for x in input_paths]
+    # 过滤无效路径
+    valid = [p for p in paths if p.exists()]
+    if not valid:
+        raise ValueError("no valid inputs")
+    markdown_list = []
+    markdown_images = []
+    # 逐项处理：目录 / PDF / 图片（已确认存在且非目录的路径按文件处理，不再重复 stat）
+    for p in valid:
+        if p.is_dir():
+            # 目录：收集图片并分批推理
+            _extend_markdown(_predict_images(pipeline, _collect_images_from_dir(p)), markdown_list, markdown_images)
+        elif _is_pdf(p):
+            # 单个 PDF：直接推理
+            _extend_markdown(pipeline.predict(input=str(p)), markdown_list, markdown_images)
+        elif _is_image(p):
+            # 单张图片：推理
+            _extend_markdown(_predict_images(pipeline, [p]), markdown_list, markdown_images)
+    # 所有输入均无有效内容，抛错
+    if not markdown_list:
+        raise ValueError("no valid image or pdf content")
+    return _write_markdown(pipeline, markdown_list, markdown_images, output_dir, "combined.md")
+
+
 def run_unified(input_arg: str | List[str], output_dir: str | Path) -> str:
     """
     统一入口：
@@ -584,141 +1273,47 @@ def run_unified(input_arg: str | List[str], output_dir: str | Path) -> str:
     pipeline = _init_pipeline()
     out_dir = Path(output_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    # 聚合 Markdown 文本及页面图片信息
-    markdown_list = []
-    markdown_images = []
+    # 各类输入统一产出 Markdown 文件路径与文本
     if isinstance(input_arg, list):
-        paths = [Path(x) for x in input_arg]
-        # 过滤无效路径
-        valid = [p for p in paths if p.exists()]
-        if not valid:
-            raise ValueError("no valid inputs")
-        # 逐项处理：目录 / PDF / 图片
-        for p in valid:
-            if p.is_dir():
-                # 目录：收集图片并逐张推理，累计 Markdown 与图片
-                imgs = _collect_images_from_dir(p)
-                for ip in imgs:
-                    img = cv2.imread(str(ip))
-                    if img is None:
-                        continue
-                    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                    output = pipeline.predict(img)
-                    for res in output:
-                        md = res.markdown
-                        markdown_list.append(md)
-                        markdown_images.append(md.get("markdown_images", {}))
-            elif p.is_file() and _is_pdf(p):
-                # 单个 PDF：直接推理，累计 Markdown 与图片
-                output = pipeline.predict(input=str(p))
-                for res in output:
-                    md = res.markdown
-                    markdown_list.append(md)
-                    markdown_images.append(md.get("markdown_images", {}))
-            elif p.is_file() and _is_image(p):
-                # 单张图片：推理，累计 Markdown 与图片
-                img = cv2.imread(str(p))
-                if img is None:
-                    continue
-                img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-                output = pipeline.predict(img)
-                for res in output:
-                    md = res.markdown
-                    markdown_list.append(md)
-                    markdown_images.append(md.get("markdown_images", {}))
+        md_path, texts = _process_mixed(pipeline, input_arg, out_dir)
+    else:
+        p = Path(input_arg)
+        if not p.exists():
+            raise FileNotFoundError(str(p))
+        if p.is_file():
+            if _is_pdf(p):
+                # 处理单个文件：PDF
+                md_path, texts = _process_pdf(pipeline, p, out_dir)
+            elif _is_image(p):
+                # 处理单个文件：图片
+                md_path, texts = _process_images(pipeline, [p], out_dir, f"{p.stem}.md")
             else:
-                continue
-        # 所有输入均无有效内容，抛错
-        if not markdown_list:
-            raise ValueError("no valid image or pdf content")
-        md_name = "combined.md"
-        # 合并 Markdown 文本
-        texts = pipeline.concatenate_markdown_pages(markdown_list)
-        md_path = out_dir / md_name
-        # 写入合并 Markdown 并保存页面图片
-        with open(md_path, "w", encoding="utf-8") as f:
-            f.write(texts)
-        _save_markdown_images(markdown_images, out_dir)
-        logger.info("Markdown 文档生成完成")
-        # 从 Markdown 抽取结构化 JSON
-        content = extract_content(texts)
-        logger.info("大模型推理并输出结构化结果完成")
-        logger.info("图片资源 Base64 转换开始")
-        # 图片路径转 Base64
-        converted = convert_images_in_json(content, base_dir=str(out_dir))
-        logger.info("图片 Base64 转换完成")
-        try:
-            # 清理中间 Markdown 文件
-            os.remove(md_path)
-        except Exception:
-            pass
-        logger.info("临时缓存文件清理完成")
-        # 返回最终 JSON 字符串
-        return converted
-    p = Path(input_arg)
-    if not p.exists():
-        raise FileNotFoundError(str(p))
-    if p.is_file():
-        if _is_pdf(p):
-            # 处理单个文件：PDF
-            md_path = _process_pdf(pipeline, p, out_dir)
-            with open(md_path, "r", encoding="utf-8") as f:
-                texts = f.read()
-            content = extract_content(texts)
-            logger.info("大模型推理并输出结构化结果完成")
-            logger.info("图片资源 Base64 转换开始")
-            # 抽取 JSON 并进行 Base64 转换
-            converted = convert_images_in_json(content, base_dir=str(out_dir))
-            logger.info("图片 Base64 转换完成")
-            try:
-                # 清理中间文件
-                os.remove(md_path)
-            except Exception:
-                pass
-            logger.info("临时缓存文件清理完成")
-            return converted
-        if _is_image(p):
-            # 处理单个文件：图片
-            md_path = _process_images(pipeline, [p], out_dir, f"{p.stem}.md")
-            with open(md_path, "r", encoding="utf-8") as f:
-                texts = f.read()
-            content = extract_content(texts)
-            logger.info("大模型推理并输出结构化结果完成")
-            logger.info("图片资源 Base64 转换开始")
-            # 抽取 JSON 并进行 Base64 转换
-            converted = convert_images_in_json(content, base_dir=str(out_dir))
-            logger.info("图片 Base64 转换完成")
-            try:
-                # 清理中间文件
-                os.remove(md_path)
-            except Exception:
-                pass
-            logger.info("临时缓存文件清理完成")
-            return converted
-        raise ValueError("unsupported file type")
-    if p.is_dir():
-        # 处理目录：收集图片并生成 Markdown
-        imgs = _collect_images_from_dir(p)
-        if not imgs:
-            raise ValueError("no images found in directory")
-        name = f"{p.name}.md" if len(imgs) > 1 else f"{imgs[0].stem}.md"
-        md_path = _process_images(pipeline, imgs, out_dir, name)
-        with open(md_path, "r", encoding="utf-8") as f:
-            texts = f.read()
-        content = extract_content(texts)
-        logger.info("大模型推理并输出结构化结果完成")
-        logger.info("图片资源 Base64 转换开始")
-        # 抽取 JSON 并进行 Base64 转换
-        converted = convert_images_in_json(content, base_dir=str(out_dir))
-        logger.info("图片 Base64 转换完成")
-        try:
-            # 清理中间文件
-            os.remove(md_path)
-        except Exception:
-            pass
-        logger.info("临时缓存文件清理完成")
-        return converted
-    raise ValueError("invalid input")
+                raise ValueError("unsupported file type")
+        elif p.is_dir():
+            # 处理目录：收集图片并生成 Markdown
+            imgs = _collect_images_from_dir(p)
+            if not imgs:
+                raise ValueError("no images found in directory")
+            name = f"{p.name}.md" if len(imgs) > 1 else f"{imgs[0].stem}.md"
+            md_path, texts = _process_images(pipeline, imgs, out_dir, name)
+        else:
+            raise ValueError("invalid input")
+
+    # 从 Markdown 抽取结构化 JSON
+    content = extract_content(texts)
+    logger.info("大模型推理并输出结构化结果完成")
+    logger.info("图片资源 Base64 转换开始")
+    # 图片路径转 Base64
+    converted = convert_images_in_json(content, base_dir=str(out_dir))
+    logger.info("图片 Base64 转换完成")
+    try:
+        # 清理中间 Markdown 文件
+        os.remove(md_path)
+    except Exception:
+        pass
+    logger.info("临时缓存文件清理完成")
+    # 返回最终 JSON 字符串
+    return converted
 
 
 def _build_arg_parser() -> argparse.ArgumentParser:
@@ -741,6 +1336,9 @@ def main() -> None:
     args = parser.parse_args()
     input_arg = args.input if len(args.input) > 1 else args.input[0]
     result_json = run_unified(input_arg, args.output)
+    # 只编码一次，文件与标准输出共用同一份 UTF-8 字节
+    data = result_json.encode("utf-8")
+    del result_json
     try:
         paths = [Path(x) for x in args.input]
         if len(paths) > 1:
@@ -752,11 +1350,15 @@ def main() -> None:
             save_dir = p if p.is_dir() else p.parent
             json_name = (p.name if p.is_dir() else p.stem) + ".json"
         save_dir.mkdir(parents=True, exist_ok=True)
-        with open(save_dir / json_name, "w", encoding="utf-8") as f:
-            f.write(result_json)
+        with open(save_dir / json_name, "wb") as f:
+            f.write(data)
     except Exception:
         pass
-    print(result_json)
+    # 直接写入标准输出的底层缓冲区，跳过文本层的再次编码
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data)
+    sys.stdout.buffer.write(b"\n")
+    sys.stdout.buffer.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+# 允许在 mate 目录下直接运行本脚本
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from main import (
+    _init_pipeline,
+    _collect_images_from_dir,
+    _process_images,
+    _build_messages,
+    _strip_code_fence,
+    _get_llm_client,
+    enable_llm_cache,
+    extract_content_many,
+    convert_images_in_json,
+)
+
+logger = logging.getLogger("paddleocr_vl")
+logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
+
+# Batch API 的终止状态，进入其中任意一个即停止轮询
+_BATCH_DONE_STATUSES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+
+def _ocr_dirs(input_dirs: list) -> list:
+    """
+    逐张 OCR 目录中的图片，Markdown 临时文件与图片放在同一目录。
+
+    Returns:
+        list: (图片路径, 临时 md 路径, Markdown 文本) 三元组列表
+    """
+    pipeline = _init_pipeline()
+    jobs = []
+    for d in input_dirs:
+        in_dir = Path(d)
+        if not in_dir.is_dir():
+            logger.error(f"input dir not exists or not a directory: {in_dir}")
+            continue
+        for p in _collect_images_from_dir(in_dir):
+            try:
+                # 裁剪图放在 imgs/<图片名>/，同目录图片间不会互相覆盖
+                md_path, texts = _process_images(pipeline, [p], p.parent, f"{p.stem}.md", image_subdir=p.stem)
+                jobs.append((p, md_path, texts))
+            except Exception as e:
+                logger.error(f"failed: {p} ({e})")
+    return jobs
+
+
+def _write_batch_file(jobs: list, batch_path: Path) -> None:
+    """
+    每个任务写成一行 Batch API 请求，请求体与 extract_content 的实时调用一致。
+    custom_id 带上序号，避免不同目录下同名图片冲突。
+    """
+    model = os.getenv("LLM_MODEL_NAME")
+    with open(batch_path, "w", encoding="utf-8") as f:
+        for i, (p, _, texts) in enumerate(jobs):
+            line = {
+                "custom_id": f"{i}-{p.stem}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": _build_messages(texts),
+                    "chat_template_kwargs": {"enable_thinking": False},
+                },
+            }
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def _run_batch(jobs: list, batch_path: Path, poll_interval: float) -> list:
+    """
+    上传 JSONL、创建批任务并轮询至结束，按 custom_id 把结果还原为与 jobs 对齐的列表。
+    未返回结果的任务对应位置为异常对象。
+    """
+    # 共享客户端关闭了 SDK 内部重试（由实时抽取的退避重试负责）；
+    # 上传与轮询不经过限速器，恢复 SDK 默认重试，避免偶发网络错误中断长时间运行的批任务
+    client = _get_llm_client().with_options(max_retries=2)
+    _write_batch_file(jobs, batch_path)
+
+    with open(batch_path, "rb") as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(f"batch created: {batch.id} ({len(jobs)} requests)")
+
+    while batch.status not in _BATCH_DONE_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        if counts is not None:
+            logger.info(f"batch {batch.id}: {batch.status} ({counts.completed}/{counts.total})")
+        else:
+            logger.info(f"batch {batch.id}: {batch.status}")
+
+    results = {}
+    if batch.output_file_id:
+        for raw in client.files.content(batch.output_file_id).text.splitlines():
+            if not raw.strip():
+                continue
+            line = json.loads(raw)
+            response = line.get("response") or {}
+            if response.get("status_code") == 200:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[line["custom_id"]] = _strip_code_fence(content)
+            else:
+                results[line["custom_id"]] = RuntimeError(str(line.get("error") or response))
+
+    if batch.status != "completed":
+        logger.error(f"batch {batch.id} ended with status: {batch.status}")
+
+    return [
+        results.get(f"{i}-{p.stem}", RuntimeError(f"no batch result (status: {batch.status})"))
+        for i, (p, _, _) in enumerate(jobs)
+    ]
+
+
+def _write_results(jobs: list, contents: list) -> None:
+    """
+    结果写回图片同目录的 json 文件，并清理临时 md。
+    """
+    for (p, md_path, _), content in zip(jobs, contents):
+        try:
+            if isinstance(content, BaseException):
+                raise content
+
+            # 与 process_images_separately 一致：json 与图片同目录，保留 imgs/ 相对路径
+            converted = convert_images_in_json(content, base_dir=str(p.parent), embed_images=False)
+            json_path = p.parent / f"{p.stem}.json"
+            json_path.write_text(converted, encoding="utf-8")
+
+            logger.info(f"saved: {json_path}")
+
+        except Exception as e:
+            logger.error(f"failed: {p} ({e})")
+
+        finally:
+            try:
+                os.remove(md_path)
+            except Exception:
+                pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, nargs="+", help="图片目录，可传多个")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="通过 Batch API 离线提交（24h 内返回，费用更低）；默认实时并发请求")
+    parser.add_argument("--batch-file", default="batch.jsonl", help="Batch API 请求文件路径")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="Batch 状态轮询间隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=20, help="实时模式下同时在途的最大请求数")
+    args = parser.parse_args()
+
+    jobs = _ocr_dirs(args.input)
+    if not jobs:
+        logger.error("no images processed")
+        return
+
+    texts = [t for _, _, t in jobs]
+    if args.batch_api:
+        contents = _run_batch(jobs, Path(args.batch_file), args.poll_interval)
+    else:
+        # 重跑同一批图片时复用已有的实时抽取结果；Batch API 路径不经过该缓存
+        enable_llm_cache()
+        contents = extract_content_many(texts, concurrency=args.concurrency, return_exceptions=True)
+
+    _write_results(jobs, contents)
+
+
+if __name__ == "__main__":
+    main()
@@ -26,9 +26,12 @@ pipeline = PaddleOCRVL(
 
 # 构建img目录下test1.png的路径
 img_path = os.path.join(os.path.dirname(__file__), "../images", "img_0001.png")
-# 读取图片为 ndarray，确保 RGB 格式
-img = cv2.imread(img_path)
-img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+# 读取图片为 ndarray，确保 RGB 格式（新版 OpenCV 可直接解码为 RGB）
+if hasattr(cv2, "IMREAD_COLOR_RGB"):
+    img = cv2.imread(img_path, cv2.IMREAD_COLOR_RGB)
+else:
+    img = cv2.imread(img_path)
+    img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
 
 output = pipeline.predict(img)
 for res in output:
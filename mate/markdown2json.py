@@ -1,25 +1,37 @@
 import os
+import re
 import json
-import base64
+import binascii
+import asyncio
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import httpx
+import orjson
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from templates import json_data
 
 load_dotenv()
 
+# 进程内共享的同步客户端，复用 HTTP keep-alive 连接与 TLS 会话
+_CLIENT = OpenAI(
+    api_key=os.getenv("LLM_MODEL_API_KEY"),
+    base_url=os.getenv("LLM_MODEL_URL"),
+    http_client=httpx.Client(limits=httpx.Limits(max_keepalive_connections=32, max_connections=64)),
+)
 
-def extract_content(text: str) -> str:
-    """
-    从用户输入的文本中提取出用户感兴趣的内容。
-    """
-    client = OpenAI(
-        api_key=os.getenv("LLM_MODEL_API_KEY"),
-        base_url=os.getenv("LLM_MODEL_URL"),
-    )
+# 大模型输出中包裹 JSON 的代码块标记（```json / ```）
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
 
-    system_prompt = f"""
+# 超过 19 位的裸整数：orjson 会静默转为 float 丢失精度，含此类数值的 JSON 改用标准库解析
+_LONG_INT = re.compile(r"(?:^|[:\[,])\s*-?\d{20,}")
+
+# 系统提示词在导入时只拼接一次，json_data 为常量
+_SYSTEM_PROMPT = f"""
     你是一个结构化信息抽取助手。请从给定的 Markdown 文本中抽取题目相关信息，并严格按照下述 JSON 模板输出，且仅输出 JSON（不要额外的解释、不要代码块、不要反引号）。
     模板（字段与顺序必须一致）：
     {json_data}
@@ -50,26 +62,134 @@ def extract_content(text: str) -> str:
     - 缺失信息使用空字符串 "" 或空数组 []，不要编造。
     - 严格输出为可解析的 JSON（无多余文字、无解释、无代码块标记）。
     """
+
+
+def _build_messages(text: str, system_suffix: str = "") -> list:
+    """
+    构造抽取请求的 system/user 消息，system_suffix 追加在系统提示词末尾。
+    """
     user_prompt = """
     请从以下文本中提取出用户感兴趣的内容：
     """ + text
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT + system_suffix},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def _clean_content(content: str) -> str:
+    # 只去掉行首/行尾的代码块标记，正文中的 "json" 等字样保持不变
+    return _FENCE.sub("", content).strip()
+
 
-    response = client.chat.completions.create(
+def extract_content(text: str) -> str:
+    """
+    从用户输入的文本中提取出用户感兴趣的内容。
+    """
+    return _clean_content("".join(_stream_deltas(text)))
+
+
+def _stream_deltas(text: str):
+    """
+    以 stream=True 请求抽取，逐段产出模型输出的文本增量。
+    """
+    stream = _CLIENT.chat.completions.create(
         model=os.getenv("LLM_MODEL_NAME"),
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        messages=_build_messages(text),
         extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+        stream=True,
     )
-    return response.choices[0].message.content.replace("```", "").replace("```json", "").replace("json", "")
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+async def _chat(client: AsyncOpenAI, sem: asyncio.Semaphore, messages: list) -> str:
+    async with sem:
+        response = await client.chat.completions.create(
+            model=os.getenv("LLM_MODEL_NAME"),
+            messages=messages,
+            extra_body={"chat_template_kwargs": {"enable_thinking": False}},
+        )
+    return _clean_content(response.choices[0].message.content)
+
+
+async def _extract_one(client: AsyncOpenAI, sem: asyncio.Semaphore, text: str) -> str:
+    return await _chat(client, sem, _build_messages(text))
+
+
+def extract_content_many(texts: list, concurrency: int = 20) -> list:
+    """
+    并发抽取多份文本，信号量限制同时在途的请求数，结果顺序与输入一致。
+    """
+    async def _run() -> list:
+        sem = asyncio.Semaphore(max(1, concurrency))
+        async with AsyncOpenAI(
+                api_key=os.getenv("LLM_MODEL_API_KEY"),
+                base_url=os.getenv("LLM_MODEL_URL"),
+        ) as client:
+            return list(await asyncio.gather(*(_extract_one(client, sem, t) for t in texts)))
+
+    return asyncio.run(_run())
+
+
+# 多文档打包时追加到系统提示词末尾的输出格式说明
+_BATCH_SUFFIX = """
+    多文档输入：
+    - 用户消息中包含多份以 ===DOC i=== 分隔的 Markdown 文档（i 从 0 开始），请对每份文档分别按上述规则抽取。
+    - 输出一个 JSON 对象，键为文档编号字符串，值为该文档的抽取结果数组，例如 {"0": [...], "1": [...]}。
+    - 每份文档都必须出现在输出中，没有题目的文档对应空数组 []。
+    """
+
+
+async def _extract_batch(client: AsyncOpenAI, sem: asyncio.Semaphore, batch: list) -> list:
+    """
+    将一批文档打包进同一个请求，系统提示词只发送一次；
+    返回结果无法解析或缺少某份文档时，整批退回逐份请求。
+    """
+    if len(batch) == 1:
+        return [await _extract_one(client, sem, batch[0])]
+
+    packed = "\n".join(f"===DOC {i}===\n{t}" for i, t in enumerate(batch))
+    content = await _chat(client, sem, _build_messages(packed, _BATCH_SUFFIX))
+    try:
+        # 与 convert_images_in_json 使用同一套解析/序列化，大整数与 NaN 的处理保持一致
+        data, from_stdlib = _loads(content)
+        return [_dumps(data[str(i)], from_stdlib) for i in range(len(batch))]
+    except (ValueError, KeyError, TypeError):
+        return list(await asyncio.gather(*(_extract_one(client, sem, t) for t in batch)))
+
+
+def extract_content_batched(texts: list, batch_size: int = 8, concurrency: int = 20) -> list:
+    """
+    每 batch_size 份文档打包成一个请求，请求数降为原来的 1/batch_size；
+    各批次之间仍并发发出，结果顺序与输入一致。
+    """
+    batch_size = max(1, batch_size)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    async def _run() -> list:
+        sem = asyncio.Semaphore(max(1, concurrency))
+        async with AsyncOpenAI(
+                api_key=os.getenv("LLM_MODEL_API_KEY"),
+                base_url=os.getenv("LLM_MODEL_URL"),
+        ) as client:
+            results = await asyncio.gather(*(_extract_batch(client, sem, b) for b in batches))
+        return [r for batch in results for r in batch]
+
+    return asyncio.run(_run())
 
 def _to_base64(fp: str) -> str:
+    # 48KB 分块流式编码（3 的倍数，块间无填充），不必把整张图片读入内存
+    parts = []
     with open(fp, "rb") as f:
-        return base64.b64encode(f.read()).decode("ascii")
+        while chunk := f.read(48 * 1024):
+            parts.append(binascii.b2a_base64(chunk, newline=False))
+    return b"".join(parts).decode("ascii")
 
-def _convert_paths(paths, base_dir: str):
+def _convert_paths(paths, base_dir: str, cache: dict | None = None):
     result = []
+    pending = []
     for p in paths:
         if not isinstance(p, str):
             result.append(p)
@@ -78,36 +198,182 @@ def _convert_paths(paths, base_dir: str):
             result.append(p)
             continue
         full = p if os.path.isabs(p) else os.path.join(base_dir, p)
+        # 同一次转换中已编码过的图片直接复用
+        if cache is not None and full in cache:
+            result.append(cache[full])
+            continue
         if os.path.isfile(full):
-            result.append(_to_base64(full))
-        else:
-            result.append(p)
+            pending.append((len(result), full))
+        result.append(p)
+    # 去重后再编码，同一数组内重复引用的图片只读一次
+    fulls = list(dict.fromkeys(full for _, full in pending))
+    # 多张图片时用线程池并行读盘编码
+    if len(fulls) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(fulls))) as ex:
+            encoded = dict(zip(fulls, ex.map(_to_base64, fulls)))
+    else:
+        encoded = {full: _to_base64(full) for full in fulls}
+    if cache is not None:
+        cache.update(encoded)
+    for i, full in pending:
+        result[i] = encoded[full]
     return result
 
-def _transform_item(item, base_dir: str):
+def _transform_item(item, base_dir: str, cache: dict | None = None):
     if not isinstance(item, dict):
         return item
     if "question_images" in item and isinstance(item["question_images"], list):
-        item["question_images"] = _convert_paths(item["question_images"], base_dir)
+        item["question_images"] = _convert_paths(item["question_images"], base_dir, cache)
     if "analysis_images" in item and isinstance(item["analysis_images"], list):
-        item["analysis_images"] = _convert_paths(item["analysis_images"], base_dir)
+        item["analysis_images"] = _convert_paths(item["analysis_images"], base_dir, cache)
     if "sub_questions" in item and isinstance(item["sub_questions"], list):
-        item["sub_questions"] = [_transform_item(x, base_dir) for x in item["sub_questions"]]
+        item["sub_questions"] = [_transform_item(x, base_dir, cache) for x in item["sub_questions"]]
     return item
 
+def _loads(s: str):
+    """
+    解析 JSON，返回 (数据, 是否由标准库解析)。
+    含超过 19 位的整数，或 orjson 不接受的写法（如 NaN）时改用标准库；都无法解析时抛出 ValueError。
+    """
+    if _LONG_INT.search(s) is None:
+        try:
+            return orjson.loads(s), False
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(s), True
+
+def _dumps(data, from_stdlib: bool) -> str:
+    # 由标准库解析的数据也用标准库序列化，保留大整数与 NaN/Infinity（orjson 会写成 null）
+    if from_stdlib:
+        return json.dumps(data, ensure_ascii=False)
+    return orjson.dumps(data).decode("utf-8")
+
 def convert_images_in_json(json_input: str, base_dir: str = ".") -> str:
     try:
-        data = json.loads(json_input)
-    except json.JSONDecodeError:
+        data, from_stdlib = _loads(json_input)
+    except ValueError:
         return json_input
+    # 本次转换内按完整路径缓存 base64，跨题目、跨子问重复引用的图片只编码一次
+    cache = {}
     if isinstance(data, list):
-        data = [_transform_item(x, base_dir) for x in data]
+        data = [_transform_item(x, base_dir, cache) for x in data]
     elif isinstance(data, dict):
-        data = _transform_item(data, base_dir)
-    return json.dumps(data, ensure_ascii=False)
+        data = _transform_item(data, base_dir, cache)
+    return _dumps(data, from_stdlib)
+
+class _ArrayItemSplitter:
+    """
+    增量切分顶层 JSON 数组：每喂入一段文本，返回其中新闭合的顶层元素原文。
+    数组之前的代码块标记等字符被忽略；顶层不是数组时 is_array 为 False，由调用方整体回退。
+    """
+
+    def __init__(self):
+        self._buf = []
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self.started = False
+        self.done = False
+        self.is_array = True
+
+    def feed(self, chunk: str) -> list:
+        out = []
+        for ch in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if ch == "[":
+                    self.started = True
+                    self._depth = 1
+                elif ch == "{":
+                    self.is_array = False
+                    self.done = True
+                continue
+            if self._in_str:
+                self._buf.append(ch)
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    # 顶层数组结束
+                    self._flush(out)
+                    self.done = True
+                    continue
+                if self._depth == 1:
+                    self._buf.append(ch)
+                    self._flush(out)
+                    continue
+            elif ch == "," and self._depth == 1:
+                self._flush(out)
+                continue
+            self._buf.append(ch)
+        return out
+
+    def _flush(self, out: list) -> None:
+        s = "".join(self._buf).strip()
+        self._buf.clear()
+        if s:
+            out.append(s)
+
+
+def extract_and_convert(text: str, base_dir: str = ".") -> str:
+    """
+    流式抽取并转换图片：每当输出中的一道题（顶层数组元素）闭合，
+    就在后台线程中解析并做图片 base64 转换，与模型后续生成并行。
+    输出不是完整的 JSON 数组，或后台线程处理任一元素时出错（解析失败、图片读取失败等），
+    都回退为对完整输出整体调用 convert_images_in_json，不会返回缺少题目的部分结果。
+    """
+    q = queue.Queue()
+    splitter = _ArrayItemSplitter()
+    items = []
+    failed = []
+    # 任一元素由标准库解析时，整个数组都用标准库序列化
+    stdlib_items = []
+    cache = {}
+
+    def _worker():
+        while (chunk := q.get()) is not None:
+            # 出错后不再处理，只把队列取到结束标记为止
+            if failed:
+                continue
+            try:
+                for raw in splitter.feed(chunk):
+                    item, from_stdlib = _loads(raw)
+                    if from_stdlib:
+                        stdlib_items.append(True)
+                    items.append(_transform_item(item, base_dir, cache))
+            except Exception as e:
+                failed.append(e)
+
+    t = threading.Thread(target=_worker, daemon=True)
+    t.start()
+    parts = []
+    try:
+        for delta in _stream_deltas(text):
+            parts.append(delta)
+            q.put(delta)
+    finally:
+        q.put(None)
+        t.join()
+
+    # 整体转换时若仍遇到同样的错误（如图片无读取权限），异常直接抛给调用方
+    if failed or not splitter.is_array or not splitter.done:
+        return convert_images_in_json(_clean_content("".join(parts)), base_dir)
+    return _dumps(items, bool(stdlib_items))
+
 
-with open("output/1.md", "r", encoding="utf-8") as f:
-    text = f.read()
+if __name__ == "__main__":
+    text = Path("output/1.md").read_text(encoding="utf-8")
     content = extract_content(text)
     print(content)
     print("\n\n+\n\n")
@@ -1,28 +1,48 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
 import pypandoc
 
+# xelatex 模板参数，所有文档共用
+_PDF_EXTRA_ARGS = [
+    "--pdf-engine=xelatex",
+    # 中文字体配置
+    "-V", "mainfont=Noto Sans CJK SC",
+    "-V", "sansfont=Noto Sans CJK SC",
+    "-V", "monofont=Noto Mono",
+    "-V", "CJKmainfont=Noto Sans CJK SC",
+    # 可选：字体大小和页面边距
+    "-V", "fontsize=12pt",
+    "-V", "geometry:margin=1in"
+]
+
 
 def markdown2pdf(md_text, pdf_path):
-    extra_args = [
-        "--pdf-engine=xelatex",
-        # 中文字体配置
-        "-V", "mainfont=Noto Sans CJK SC",
-        "-V", "sansfont=Noto Sans CJK SC",
-        "-V", "monofont=Noto Mono",
-        "-V", "CJKmainfont=Noto Sans CJK SC",
-        # 可选：字体大小和页面边距
-        "-V", "fontsize=12pt",
-        "-V", "geometry:margin=1in"
-    ]
     pypandoc.convert_text(
         md_text,
         to="pdf",
         format="md",
         outputfile=pdf_path,
-        extra_args=extra_args
+        extra_args=_PDF_EXTRA_ARGS
     )
 
 
+def markdown2pdf_many(items, max_workers=None):
+    """
+    批量转换 [(md_text, pdf_path), ...]。
+    每个文档仍由独立的 pandoc + xelatex 进程生成（pandoc server 模式不支持输出 PDF），
+    多个进程并行运行，总耗时不再是各文档启动开销之和。
+    """
+    items = list(items)
+    if not items:
+        return
+    workers = max_workers or min(len(items), os.cpu_count() or 4)
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # list() 触发执行并把子任务中的异常抛给调用方
+        list(ex.map(lambda it: markdown2pdf(*it), items))
+
+
 if __name__ == '__main__':
-    with open("../存题标准.md", "r", encoding="utf-8") as f:
-        md_text = f.read()
+    md_text = Path("../存题标准.md").read_text(encoding="utf-8")
     markdown2pdf(md_text, "存题标准.pdf")
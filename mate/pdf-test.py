@@ -1,4 +1,5 @@
 import os
+import re
 from pathlib import Path
 import warnings
 
@@ -19,40 +20,52 @@ pipeline = PaddleOCRVL(
     doc_unwarping_model_dir=layout_model_path
 )
 
-# 指定单个 PDF 文件路径
-pdf_path = Path(os.path.dirname(__file__)) / "pdf" / "2.pdf"
+# 处理 pdf 目录下的全部 PDF 文件
+pdf_dir = Path(os.path.dirname(__file__)) / "pdf"
+pdf_paths = sorted(pdf_dir.glob("*.pdf"))
 
 # 输出目录
 output_dir = Path(os.path.dirname(__file__)) / "output"
 output_dir.mkdir(parents=True, exist_ok=True)
 
-print(f"Processing {pdf_path.name}...")
+# 所有 PDF 共用同一个 pipeline，模型只加载一次
+for pdf_path in pdf_paths:
+    print(f"Processing {pdf_path.name}...")
 
-# 调用 pipeline predict，batch=1
-output = pipeline.predict(input=str(pdf_path))
+    output = pipeline.predict(input=str(pdf_path))
 
-markdown_list = []
-markdown_images = []
+    markdown_list = []
+    markdown_images = []
 
-for res in output:
-    md_info = res.markdown
-    markdown_list.append(md_info)
-    markdown_images.append(md_info.get("markdown_images", {}))
+    for res in output:
+        md_info = res.markdown
+        markdown_list.append(md_info)
+        markdown_images.append(md_info.get("markdown_images", {}))
 
-# 合并多页 Markdown
-markdown_texts = pipeline.concatenate_markdown_pages(markdown_list)
+    # 合并多页 Markdown
+    markdown_texts = pipeline.concatenate_markdown_pages(markdown_list)
 
-# 保存 Markdown 文件
-mkd_file_path = output_dir / f"{pdf_path.stem}.md"
-with open(mkd_file_path, "w", encoding="utf-8") as f:
-    f.write(markdown_texts)
+    # 裁剪图只以框坐标命名，多个 PDF 共用 output/imgs 时会互相覆盖，
+    # 因此每个 PDF 的图片放到 imgs/<PDF 名>/ 下，并同步改写 Markdown 中的引用
+    renamed = {}
+    for item in markdown_images:
+        if item:
+            for path, image in item.items():
+                head, _, name = path.rpartition("/")
+                new_path = f"{head}/{pdf_path.stem}/{name}" if head else f"{pdf_path.stem}/{name}"
+                renamed[path] = (new_path, image)
+    if renamed:
+        pattern = re.compile("|".join(map(re.escape, sorted(renamed, key=len, reverse=True))))
+        markdown_texts = pattern.sub(lambda m: renamed[m.group(0)][0], markdown_texts)
 
-# 保存每页对应图片
-for item in markdown_images:
-    if item:
-        for path, image in item.items():
-            file_path = output_dir / path
-            file_path.parent.mkdir(parents=True, exist_ok=True)
-            image.save(file_path)
+    # 保存 Markdown 文件
+    mkd_file_path = output_dir / f"{pdf_path.stem}.md"
+    mkd_file_path.write_text(markdown_texts, encoding="utf-8")
 
-print(f"Finished processing {pdf_path.name}, output saved to {output_dir}")
+    # 保存每页对应图片
+    for new_path, image in renamed.values():
+        file_path = output_dir / new_path
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        image.save(file_path)
+
+    print(f"Finished processing {pdf_path.name}, output saved to {output_dir}")
@@ -1,12 +1,23 @@
+import asyncio
 import logging
+import multiprocessing
 import os
+import queue
+import re
+import threading
 from pathlib import Path
 
+from dotenv import load_dotenv
+
 from main import (
     _init_pipeline,
     _collect_images_from_dir,
     _process_images,
+    _new_async_llm_client,
+    _env_positive_int,
+    enable_llm_cache,
     extract_content,
+    extract_content_async,
     convert_images_in_json,
 )
 
@@ -14,55 +25,177 @@ logger = logging.getLogger("paddleocr_vl")
 logging.basicConfig(level=logging.INFO, format="[%(levelname)s] %(message)s")
 
 
-def process_dir(input_dir: str | Path) -> None:
-    pipeline = _init_pipeline()
-    in_dir = Path(input_dir)
+# OCR 结果队列的容量：OCR 最多领先 LLM 阶段这么多张图片
+_OCR_QUEUE_SIZE = 4
+# 低于该字符数的 Markdown（空白页、纯图片页）不调用 LLM，直接输出空数组
+_MIN_TEXT_LEN = 50
+# 中文字符；不含中文的 OCR 结果视为没有可抽取的题目
+_RE_CJK = re.compile(r"[\u4e00-\u9fff]")
+# 限速环境变量：限速器是进程内对象，多进程时需把额度均分给各子进程
+_LIMIT_ENV_VARS = ("LLM_MAX_RPM", "LLM_MAX_TPM")
 
-    if not in_dir.exists() or not in_dir.is_dir():
-        raise ValueError(f"input dir not exists or not a directory: {in_dir}")
 
-    imgs = _collect_images_from_dir(in_dir)
-    if not imgs:
-        raise ValueError("no images found in directory")
+def _worth_extracting(texts: str) -> bool:
+    """
+    判断 OCR 文本是否值得调用 LLM 抽取：过短或不含中文时跳过。
+    """
+    return len(texts) >= _MIN_TEXT_LEN and _RE_CJK.search(texts) is not None
 
-    for p in imgs:
-        try:
-            # json 和图片放在同一个目录
-            out_dir = p.parent
 
-            # 临时 md 文件名
-            md_name = f"{p.stem}.md"
+def _ocr_producer(pipeline, imgs, q: queue.Queue) -> None:
+    """
+    生产者：逐张 OCR 并把 (图片路径, 临时 md 路径, Markdown 文本) 放入队列，结束时放入 None。
+    """
+    try:
+        for p in imgs:
+            try:
+                # json 和图片放在同一个目录
+                out_dir = p.parent
 
-            md_path = _process_images(
-                pipeline,
-                [p],
-                out_dir,
-                md_name,
-            )
+                # 临时 md 文件名
+                md_name = f"{p.stem}.md"
 
-            with open(md_path, "r", encoding="utf-8") as f:
-                texts = f.read()
+                # 同目录下各图片的裁剪图分别放在 imgs/<图片名>/，坐标相同也不会互相覆盖
+                md_path, texts = _process_images(
+                    pipeline,
+                    [p],
+                    out_dir,
+                    md_name,
+                    image_subdir=p.stem,
+                )
+                q.put((p, md_path, texts))
 
-            content = extract_content(texts)
-            converted = convert_images_in_json(
-                content,
-                base_dir=str(out_dir),
-            )
+            except Exception as e:
+                logger.error(f"failed: {p} ({e})")
+    finally:
+        q.put(None)
+
+
+def _save_json(p: Path, content: str) -> None:
+    out_dir = p.parent
+    converted = convert_images_in_json(
+        content,
+        base_dir=str(out_dir),
+        embed_images=False,
+    )
+
+    json_path = out_dir / f"{p.stem}.json"
+    json_path.write_text(converted, encoding="utf-8")
+
+    logger.info(f"saved: {json_path}")
 
-            # 删除临时 md
+
+async def _llm_consumer(q: queue.Queue, concurrency: int) -> None:
+    """
+    消费者：从队列取出 OCR 结果并发调用 LLM，最多 concurrency 个请求同时在途；
+    在途请求已满时不再取队列，队列满后 OCR 线程随之阻塞，形成背压。
+    """
+    loop = asyncio.get_running_loop()
+    sem = asyncio.Semaphore(max(1, concurrency))
+    tasks = []
+
+    async with _new_async_llm_client() as client:
+        async def _one(p: Path, md_path: Path, texts: str) -> None:
             try:
-                os.remove(md_path)
-            except Exception:
-                pass
+                if _worth_extracting(texts):
+                    content = await extract_content_async(texts, client)
+                else:
+                    logger.info(f"skip llm (no extractable text): {p}")
+                    content = "[]"
+                # 图片内联与写文件是阻塞 I/O，放到线程池，不占用事件循环
+                await loop.run_in_executor(None, _save_json, p, content)
+
+            except Exception as e:
+                logger.error(f"failed: {p} ({e})")
 
-            json_path = out_dir / f"{p.stem}.json"
-            with open(json_path, "w", encoding="utf-8") as f:
-                f.write(converted)
+            finally:
+                sem.release()
+                # 删除临时 md
+                try:
+                    os.remove(md_path)
+                except Exception:
+                    pass
 
-            logger.info(f"saved: {json_path}")
+        while True:
+            await sem.acquire()
+            item = await loop.run_in_executor(None, q.get)
+            if item is None:
+                sem.release()
+                break
+            tasks.append(asyncio.create_task(_one(*item)))
 
-        except Exception as e:
-            logger.error(f"failed: {p} ({e})")
+        await asyncio.gather(*tasks)
+
+
+def _process_shard(imgs: list, concurrency: int) -> None:
+    """
+    在当前进程内处理一组图片：OCR（GPU）在独立线程中生产，LLM（网络）在事件循环中消费，两个阶段同时进行。
+    """
+    pipeline = _init_pipeline()
+    q = queue.Queue(maxsize=_OCR_QUEUE_SIZE)
+    producer = threading.Thread(target=_ocr_producer, args=(pipeline, imgs, q), daemon=True)
+    producer.start()
+    asyncio.run(_llm_consumer(q, concurrency))
+    producer.join()
+
+
+def _per_worker_limits(workers: int) -> dict:
+    """
+    把 LLM_MAX_RPM / LLM_MAX_TPM 按进程数均分（向下取整，至少为 1），各进程合计不超过配置值。
+    未设置的限速项不出现在返回值中。
+    """
+    # 限速值可能写在 .env 中，先加载再读取
+    load_dotenv()
+    limits = {}
+    for name in _LIMIT_ENV_VARS:
+        total = _env_positive_int(name)
+        if total:
+            limits[name] = str(max(1, total // workers))
+    return limits
+
+
+def _work_shard(args) -> int:
+    """
+    子进程入口：每个子进程各自加载一份 pipeline，处理分配到的图片。
+    限速器在首次请求时才读取环境变量，这里先写入本进程分到的限速额度。
+    """
+    imgs, concurrency, limits = args
+    os.environ.update(limits)
+    _process_shard(imgs, concurrency)
+    return len(imgs)
+
+
+def process_dir(input_dir: str | Path, concurrency: int = 20, workers: int = 1) -> None:
+    """
+    逐张处理目录中的图片，每张图片输出同名 json。
+
+    Args:
+        input_dir (str | Path): 图片目录
+        concurrency (int): 每个进程同时在途的 LLM 请求数
+        workers (int): OCR 进程数。每个进程各自加载一份模型，
+            取值约为 floor(可用显存 / 单份模型显存占用)，默认为1（不启用多进程）。
+            LLM_MAX_RPM / LLM_MAX_TPM 为所有进程合计的上限，由各进程均分
+    """
+    in_dir = Path(input_dir)
+
+    if not in_dir.exists() or not in_dir.is_dir():
+        raise ValueError(f"input dir not exists or not a directory: {in_dir}")
+
+    imgs = _collect_images_from_dir(in_dir)
+    if not imgs:
+        raise ValueError("no images found in directory")
+
+    workers = max(1, min(workers, len(imgs)))
+    if workers == 1:
+        _process_shard(imgs, concurrency)
+        return
+
+    # 按轮转方式切分，各进程分到的图片数相差不超过 1；spawn 避免 fork 继承已初始化的 CUDA 上下文
+    limits = _per_worker_limits(workers)
+    shards = [(imgs[i::workers], concurrency, limits) for i in range(workers)]
+    with multiprocessing.get_context("spawn").Pool(processes=workers) as pool:
+        for n in pool.imap_unordered(_work_shard, shards):
+            logger.info(f"worker finished: {n} images")
 
 def process_image(image_path: str | Path) -> None:
     pipeline = _init_pipeline()
@@ -75,20 +208,23 @@ def process_image(image_path: str | Path) -> None:
         out_dir = p.parent
         md_name = f"{p.stem}.md"
 
-        md_path = _process_images(
+        md_path, texts = _process_images(
             pipeline,
             [p],
             out_dir,
             md_name,
+            image_subdir=p.stem,
         )
 
-        with open(md_path, "r", encoding="utf-8") as f:
-            texts = f.read()
-
-        content = extract_content(texts)
+        if _worth_extracting(texts):
+            content = extract_content(texts)
+        else:
+            logger.info(f"skip llm (no extractable text): {p}")
+            content = "[]"
         converted = convert_images_in_json(
             content,
             base_dir=str(out_dir),
+            embed_images=False,
         )
 
         # 删除临时 md
@@ -98,8 +234,7 @@ def process_image(image_path: str | Path) -> None:
             pass
 
         json_path = out_dir / f"{p.stem}.json"
-        with open(json_path, "w", encoding="utf-8") as f:
-            f.write(converted)
+        json_path.write_text(converted, encoding="utf-8")
 
         logger.info(f"saved: {json_path}")
 
@@ -107,9 +242,13 @@ def process_image(image_path: str | Path) -> None:
         logger.error(f"failed: {p} ({e})")
 
 if __name__ == "__main__":
+    # 重跑同一批图片时复用已有的抽取结果；环境变量供 workers > 1 时 spawn 出的子进程继承
+    os.environ.setdefault("PAPERCUTTER_LLM_CACHE", "1")
+    enable_llm_cache()
+    # _init_pipeline 是进程级单例，下面多个目录/图片共用同一份已加载的模型权重
     path_list = []
-    # for path in path_list:
-    #     process_dir(path)
+    for path in path_list:
+        process_dir(path)
     # # ✅ 在这里直接写图片文件夹路径
     # input_dir = "/your/image/folder/path"
     #